@@ -3,186 +3,42 @@
 Build the website by combining the heatmap with a nice landing page.
 """
 
-import json
 import os
 from datetime import datetime
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from utils import load_stats, write_precompressed
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Templates are loaded once per process and never re-checked on disk
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html.j2']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+    auto_reload=False
+)
 
 
 def build_website():
     """Build the website HTML"""
 
     # Load stats
-    stats = {}
-    if os.path.exists('stats.json'):
-        with open('stats.json', 'r') as f:
-            stats = json.load(f)
+    stats = load_stats()
 
-    # Read heatmap HTML
+    # The page loads heatmap.html in an iframe, so it only has to exist
     if not os.path.exists('heatmap.html'):
         print("Error: heatmap.html not found! Run generate_heatmap.py first.")
         return
 
-    with open('heatmap.html', 'r') as f:
-        heatmap_html = f.read()
-
-    # Extract just the map portion (folium creates a full HTML doc)
-    # We'll embed it in an iframe instead
-
-    # Build minimalist full-screen page
-    html = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Activity Heatmap</title>
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@300;400&display=swap" rel="stylesheet">
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-
-        body {{
-            font-family: 'Space Grotesk', -apple-system, BlinkMacSystemFont, sans-serif;
-            height: 100vh;
-            overflow: hidden;
-            display: flex;
-            flex-direction: column;
-            background: #fafafa;
-        }}
-
-        .map-container {{
-            flex: 1;
-            position: relative;
-            overflow: hidden;
-            background: #f5f5f5;
-        }}
-
-        .loading {{
-            position: absolute;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            color: #737373;
-            font-size: 14px;
-            font-weight: 300;
-        }}
-
-        iframe {{
-            width: 100%;
-            height: 100%;
-            border: none;
-            display: block;
-            touch-action: manipulation;
-            -webkit-overflow-scrolling: touch;
-            background: transparent;
-        }}
-
-        .footer {{
-            background: #f5f5f5;
-            padding: 18px 28px;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            gap: 32px;
-            border-top: 1px solid #d4d4d4;
-            font-size: 13px;
-            letter-spacing: 0.02em;
-        }}
-
-        .footer-item {{
-            display: flex;
-            align-items: center;
-            gap: 6px;
-        }}
-
-        .footer-label {{
-            font-weight: 400;
-            color: #171717;
-        }}
-
-        .footer-value {{
-            font-weight: 300;
-            color: #737373;
-        }}
-
-        .footer-separator {{
-            color: #d4d4d4;
-        }}
-
-        @media (max-width: 768px) {{
-            .footer {{
-                padding: 14px 18px;
-                font-size: 12px;
-                flex-direction: column;
-                gap: 8px;
-            }}
-
-            .footer-separator {{
-                display: none;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="map-container">
-        <div class="loading" id="loading">Loading map...</div>
-        <iframe src="heatmap.html" title="Activity Heatmap" id="map-iframe" onload="hideLoading()"></iframe>
-    </div>
-    <div class="footer">
-        <div class="footer-item">
-            <span class="footer-label">Jesse Alloy</span>
-        </div>
-        <span class="footer-separator">·</span>
-        <div class="footer-item">
-            <span class="footer-value">{stats.get('total_activities', 0)} activities</span>
-        </div>
-        {f'''<span class="footer-separator">·</span>
-        <div class="footer-item">
-            <span class="footer-label">Latest:</span>
-            <span class="footer-value">{stats['last_activity']['name']}</span>
-        </div>
-        <span class="footer-separator">·</span>
-        <div class="footer-item">
-            <span class="footer-value">{stats['last_activity']['date']}</span>
-        </div>''' if stats.get('last_activity') else ''}
-    </div>
-    <script>
-        function hideLoading() {{
-            const loading = document.getElementById('loading');
-            if (loading) {{
-                loading.style.display = 'none';
-            }}
-        }}
-
-        // Fallback timeout - if map doesn't load in 10 seconds, show error
-        setTimeout(function() {{
-            const loading = document.getElementById('loading');
-            if (loading && loading.style.display !== 'none') {{
-                loading.textContent = 'Map failed to load. Try refreshing.';
-            }}
-        }}, 10000);
-
-        // Also try to detect iframe load errors
-        const iframe = document.getElementById('map-iframe');
-        iframe.onerror = function() {{
-            const loading = document.getElementById('loading');
-            if (loading) {{
-                loading.textContent = 'Error loading map';
-                loading.style.display = 'block';
-            }}
-        }};
-    </script>
-</body>
-</html>
-"""
-
-    # Save index.html
-    with open('index.html', 'w') as f:
-        f.write(html)
+    # Render the page
+    template = _env.get_template('index.html.j2')
+    # A 1 MiB buffer lets the streamed chunks reach disk in a single write
+    with open('index.html', 'w', encoding='utf-8', buffering=1 << 20) as f:
+        template.stream(stats=stats).dump(f)
+    write_precompressed('index.html')
 
     print("✓ Website built: index.html")
     print("\nFiles needed for deployment:")
@@ -4,128 +4,60 @@ Generate an interactive heatmap from GeoJSON activity data.
 Creates an HTML file with a zoomable, pannable heatmap visualization.
 """
 
-import json
+import hashlib
+import ijson
+import numpy as np
+import orjson
 import folium
+from branca.element import Element
 from folium.plugins import HeatMap
+from jinja2 import Template
 import webbrowser
 import os
+import zipfile
+from html import escape
+from pathlib import Path
+from utils import find_geojson, load_stats, open_geojson, write_precompressed
 
 
-class HeatmapGenerator:
-    """Generate interactive heatmap from activity data"""
-
-    def __init__(self, geojson_file='activities.geojson', output_file='heatmap.html'):
-        self.geojson_file = geojson_file
-        self.output_file = output_file
-        self.all_points = []
-
-    def load_geojson(self):
-        """Load GeoJSON file and extract all GPS points"""
-        if not os.path.exists(self.geojson_file):
-            print(f"Error: {self.geojson_file} not found!")
-            print("Run import_gpx.py first to create the GeoJSON file")
-            return False
-
-        with open(self.geojson_file, 'r') as f:
-            data = json.load(f)
+# Placeholders in the cached page skeleton where the heatmap points and the
+# footer are spliced in
+HEATMAP_DATA_MARKER = '/*__HEATMAP_DATA__*/'
+FOOTER_MARKER = '<!--__FOOTER__-->'
 
-        if not data.get('features'):
-            print("No activities found in GeoJSON file")
-            return False
 
-        print(f"Loading {len(data['features'])} activities...")
+class PlaceholderHeatMap(HeatMap):
+    """HeatMap layer that renders a data placeholder instead of its points
 
-        # Extract all coordinate points
-        for feature in data['features']:
-            if feature['geometry']['type'] == 'LineString':
-                coords = feature['geometry']['coordinates']
-                # Convert from [lon, lat, alt] to [lat, lon] for folium
-                for coord in coords:
-                    self.all_points.append([coord[1], coord[0]])
-
-        print(f"Loaded {len(self.all_points):,} GPS points")
-        return True
-
-    def calculate_center(self):
-        """Calculate center point of all activities"""
-        if not self.all_points:
-            return [0, 0]
-
-        avg_lat = sum(p[0] for p in self.all_points) / len(self.all_points)
-        avg_lon = sum(p[1] for p in self.all_points) / len(self.all_points)
-
-        return [avg_lat, avg_lon]
-
-    def create_heatmap(self, gradient=None, center=None, zoom_start=11):
-        """Create the heatmap visualization
+    The points are spliced in as a JSON string literal handed to JSON.parse,
+    which browsers parse much faster than an equally large array literal.
+    The binned points are plain numbers, so the JSON needs no escaping.
+    """
 
-        Args:
-            gradient: Color gradient dictionary
-            center: [lat, lon] to center the map (default: Anchorage, AK)
-            zoom_start: Initial zoom level
+    _template = Template(
         """
-        if not self.all_points:
-            return None
-
-        # Use Anchorage, Alaska as default center (1.5 miles SE of downtown)
-        if center is None:
-            center = [61.2027, -149.8691]  # Anchorage, AK
-
-        print(f"Map center: {center[0]:.4f}, {center[1]:.4f}")
-
-        # Create base map
-        m = folium.Map(
-            location=center,
-            zoom_start=zoom_start,
-            tiles='OpenStreetMap'
-        )
-
-        # Add additional tile layers
-        folium.TileLayer('CartoDB positron', name='Light Map').add_to(m)
-        folium.TileLayer('CartoDB dark_matter', name='Dark Map').add_to(m)
-
-        # Default gradient (blue to red)
-        if gradient is None:
-            gradient = {
-                0.0: 'blue',
-                0.3: 'cyan',
-                0.5: 'lime',
-                0.7: 'yellow',
-                1.0: 'red'
-            }
-
-        # Create heatmap layer
-        print("Generating heatmap...")
-        HeatMap(
-            self.all_points,
-            min_opacity=0.4,
-            max_zoom=18,
-            radius=2,
-            blur=1,
-            gradient=gradient
-        ).add_to(m)
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.heatLayer(
+                JSON.parse('""" + HEATMAP_DATA_MARKER + """'),
+                {{ this.options|tojson }}
+            );
+        {% endmacro %}
+        """
+    )
 
-        # Add layer control
-        folium.LayerControl().add_to(m)
+    def __init__(self, **kwargs):
+        super().__init__([], **kwargs)
 
-        return m
 
-    def _inject_mobile_fix(self):
-        """Inject mobile fixes and footer directly into heatmap.html"""
-        # Read the generated HTML
-        with open(self.output_file, 'r') as f:
-            html = f.read()
+class MobileMap(folium.Map):
+    """Map that renders a mobile-friendly page with room for the footer
 
-        # Fix the viewport meta tag for mobile (add viewport-fit=cover)
-        html = html.replace(
-            'width=device-width,\n                initial-scale=1.0, maximum-scale=1.0, user-scalable=no',
-            'width=device-width, initial-scale=1.0, viewport-fit=cover'
-        )
+    The page fixes are contributed through folium's own element tree while
+    rendering, so the generated HTML never needs patching afterwards.
+    """
 
-        # Fix body/html sizing - replace folium's default with explicit sizing
-        html = html.replace(
-            '<style>html, body {width: 100%;height: 100%;margin: 0;padding: 0;}</style>',
-            '''<style>
+    # Explicit html/body sizing, replacing folium's default
+    BODY_STYLE = '''<style>
 html, body {
     width: 100%;
     height: 100vh;
@@ -135,10 +67,9 @@ html, body {
     overflow: hidden;
 }
 </style>'''
-        )
 
-        # Add footer styles and content before </body>
-        footer_content = '''
+    # Footer styles, added before </body>
+    FOOTER_STYLE = '''
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@300;400&display=swap');
 .footer {
@@ -191,27 +122,10 @@ html, body {
     }
 }
 </style>
-<div class="footer">
-    <div class="footer-item">
-        <span class="footer-label">Jesse Alloy</span>
-    </div>
-    <span class="footer-separator">·</span>
-    <div class="footer-item">
-        <span class="footer-value">84 activities</span>
-    </div>
-    <span class="footer-separator">·</span>
-    <div class="footer-item">
-        <span class="footer-label">Latest:</span>
-        <span class="footer-value">Afternoon Trail Run</span>
-    </div>
-    <span class="footer-separator">·</span>
-    <div class="footer-item">
-        <span class="footer-value">Dec 01, 2025</span>
-    </div>
-</div>
 '''
-        # Add script to invalidate map size after load
-        resize_script = '''
+
+    # Script to invalidate map size after load
+    RESIZE_SCRIPT = '''
 <script>
 // Wait for map to initialize then fix size
 window.addEventListener('load', function() {
@@ -227,31 +141,321 @@ window.addEventListener('load', function() {
 });
 </script>
 '''
-        html = html.replace('</body>', footer_content + resize_script + '</body>')
 
-        # Write back
-        with open(self.output_file, 'w') as f:
-            f.write(html)
+    # folium's Map header, with viewport-fit=cover instead of disabling zoom
+    _header_template = Template(
+        """
+        {% macro header(this, kwargs) %}
+            <meta name="viewport" content="width=device-width, initial-scale=1.0, viewport-fit=cover" />
+            <style>
+                #{{ this.get_name() }} {
+                    position: {{this.position}};
+                    width: {{this.width[0]}}{{this.width[1]}};
+                    height: {{this.height[0]}}{{this.height[1]}};
+                    left: {{this.left[0]}}{{this.left[1]}};
+                    top: {{this.top[0]}}{{this.top[1]}};
+                }
+                .leaflet-container { font-size: 1rem; }
+            </style>
+        {% endmacro %}
+        """
+    )
+
+    def render(self, **kwargs):
+        """Render the map, then swap in the mobile header and add the footer"""
+        super().render(**kwargs)
+        figure = self.get_root()
+
+        # Replacing children by name keeps their position in the page
+        header = self._header_template.module.header(self, kwargs)
+        figure.header.add_child(Element(header), name=self.get_name())
+        figure.header.add_child(Element(self.BODY_STYLE), name='css_style')
+
+        # The footer content itself is left as a placeholder since it
+        # changes with every new activity
+        figure.html.add_child(
+            Element(self.FOOTER_STYLE + FOOTER_MARKER + self.RESIZE_SCRIPT),
+            name='footer'
+        )
+
 
-        print("Injected mobile fixes and footer")
+class HeatmapGenerator:
+    """Generate interactive heatmap from activity data"""
 
-    def generate(self, open_browser=True):
+    # Footer content, filled in from stats.json on every build
+    FOOTER_TEMPLATE = '''<div class="footer">
+    <div class="footer-item">
+        <span class="footer-label">Jesse Alloy</span>
+    </div>
+    <span class="footer-separator">·</span>
+    <div class="footer-item">
+        <span class="footer-value">{activities} activities</span>
+    </div>
+    <span class="footer-separator">·</span>
+    <div class="footer-item">
+        <span class="footer-label">Latest:</span>
+        <span class="footer-value">{latest}</span>
+    </div>
+    <span class="footer-separator">·</span>
+    <div class="footer-item">
+        <span class="footer-value">{date}</span>
+    </div>
+</div>
+'''
+
+    def __init__(self, geojson_file='activities.geojson', output_file='heatmap.html'):
+        self.geojson_file = find_geojson(geojson_file)
+        self.output_file = output_file
+        self.all_points = np.empty((0, 2))
+        self.activity_count = 0
+
+    def load_geojson(self):
+        """Load GeoJSON file and extract all GPS points"""
+        if not os.path.exists(self.geojson_file):
+            print(f"Error: {self.geojson_file} not found!")
+            print("Run import_gpx.py first to create the GeoJSON file")
+            return False
+
+        # Reuse the points extracted by a previous run if the GeoJSON is unchanged
+        st = os.stat(self.geojson_file)
+        if self._load_cache(st):
+            return True
+
+        # Stream features one at a time so the whole document is never
+        # held in memory
+        chunks = []
+        activity_count = 0
+        with open_geojson(self.geojson_file) as f:
+            for feature in ijson.items(f, 'features.item', use_float=True):
+                activity_count += 1
+                if feature['geometry']['type'] == 'LineString':
+                    coords = np.asarray(feature['geometry']['coordinates'], dtype=np.float64)
+                    if len(coords):
+                        # Convert from [lon, lat, alt] to [lat, lon] for folium
+                        chunks.append(coords[:, 1::-1])
+
+        if not activity_count:
+            print("No activities found in GeoJSON file")
+            return False
+
+        self.activity_count = activity_count
+        if chunks:
+            self.all_points = np.concatenate(chunks, axis=0)
+
+        self._save_cache(st, activity_count)
+
+        print(f"Loaded {activity_count} activities")
+        print(f"Loaded {len(self.all_points):,} GPS points")
+        return True
+
+    def _cache_file(self):
+        """Path of the binary points cache kept next to the GeoJSON file"""
+        return self.geojson_file + '.cache.npz'
+
+    def _load_cache(self, st):
+        """Load cached points if they were extracted from this exact GeoJSON file"""
+        cache_file = self._cache_file()
+        if not os.path.exists(cache_file):
+            return False
+
+        try:
+            with np.load(cache_file) as cache:
+                if int(cache['mtime']) != st.st_mtime_ns or int(cache['size']) != st.st_size:
+                    return False
+                self.all_points = cache['points']
+                self.activity_count = int(cache['activities'])
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # A truncated or corrupted cache is just a miss; the GeoJSON is
+            # parsed again and the cache rewritten
+            return False
+
+        print(f"Loaded {self.activity_count} activities (cached)")
+        print(f"Loaded {len(self.all_points):,} GPS points")
+        return True
+
+    def _save_cache(self, st, activity_count):
+        """Save extracted points keyed on the GeoJSON file's mtime and size"""
+        cache_file = self._cache_file()
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            np.savez(
+                f,
+                points=self.all_points,
+                activities=activity_count,
+                mtime=st.st_mtime_ns,
+                size=st.st_size
+            )
+        # Atomic rename so an interrupted run never leaves a partial cache
+        os.replace(tmp_file, cache_file)
+
+    def prime_cache(self, points, activity_count):
+        """Seed the points cache for a GeoJSON file that was just written
+
+        Lets the script that wrote the GeoJSON hand over the [lat, lon]
+        points it already has, so the next build doesn't parse the file.
+        """
+        self.all_points = points
+        self.activity_count = activity_count
+        self._save_cache(os.stat(self.geojson_file), activity_count)
+
+    def calculate_center(self):
+        """Calculate center point of all activities"""
+        if not len(self.all_points):
+            return [0, 0]
+
+        return self.all_points.mean(axis=0).tolist()
+
+    def bin_points(self, precision=5):
+        """Snap points to a grid and weight each cell by its point count
+
+        Leaflet.heat sums the weights of all points falling in a pixel, so a
+        [lat, lon, count] triple renders the same as count separate points.
+
+        Args:
+            precision: Decimal places to keep (5 is roughly 1 m)
+
+        Returns:
+            List of [lat, lon, weight] triples
+        """
+        scale = 10 ** precision
+        quantized = np.round(self.all_points * scale).astype(np.int64)
+
+        # Pack each (lat, lon) cell into one int64 so np.unique can sort a
+        # flat array instead of comparing rows
+        keys = (quantized[:, 0] << 32) | (quantized[:, 1] & 0xFFFFFFFF)
+        cells, counts = np.unique(keys, return_counts=True)
+
+        lats = (cells >> 32) / scale
+        lons = (cells & 0xFFFFFFFF).astype(np.uint32).view(np.int32) / scale
+        return [
+            [lat, lon, count]
+            for lat, lon, count in zip(lats.tolist(), lons.tolist(), counts.tolist())
+        ]
+
+    def create_heatmap(self, gradient=None, center=None, zoom_start=11):
+        """Create the heatmap visualization
+
+        The heatmap layer renders HEATMAP_DATA_MARKER in place of its points;
+        generate() splices the binned points in after rendering.
+
+        Args:
+            gradient: Color gradient dictionary
+            center: [lat, lon] to center the map (default: Anchorage, AK)
+            zoom_start: Initial zoom level
+        """
+        # Use Anchorage, Alaska as default center (1.5 miles SE of downtown)
+        if center is None:
+            center = [61.2027, -149.8691]  # Anchorage, AK
+
+        print(f"Map center: {center[0]:.4f}, {center[1]:.4f}")
+
+        # Create base map
+        m = MobileMap(
+            location=center,
+            zoom_start=zoom_start,
+            tiles='OpenStreetMap'
+        )
+
+        # Add additional tile layers
+        folium.TileLayer('CartoDB positron', name='Light Map').add_to(m)
+        folium.TileLayer('CartoDB dark_matter', name='Dark Map').add_to(m)
+
+        # Default gradient (blue to red)
+        if gradient is None:
+            gradient = {
+                0.0: 'blue',
+                0.3: 'cyan',
+                0.5: 'lime',
+                0.7: 'yellow',
+                1.0: 'red'
+            }
+
+        # Create heatmap layer
+        PlaceholderHeatMap(
+            min_opacity=0.4,
+            max_zoom=18,
+            radius=2,
+            blur=1,
+            gradient=gradient
+        ).add_to(m)
+
+        # Add layer control
+        folium.LayerControl().add_to(m)
+
+        return m
+
+    def _skeleton_file(self):
+        """Path of the cached page skeleton kept next to the output file"""
+        root, ext = os.path.splitext(self.output_file)
+        return f"{root}_skeleton{ext}"
+
+    def render_skeleton(self, gradient=None, center=None, zoom_start=11):
+        """Render the heatmap page without its points, reusing the cached skeleton
+
+        The skeleton only depends on the map settings, the folium version and
+        this script, so folium is skipped entirely when only the activity
+        data changed.
+        """
+        digest = hashlib.sha1()
+        digest.update(orjson.dumps(
+            [gradient, center, zoom_start, folium.__version__],
+            option=orjson.OPT_NON_STR_KEYS
+        ))
+        digest.update(Path(__file__).read_bytes())
+        header = f"<!-- skeleton:{digest.hexdigest()} -->\n"
+
+        skeleton_file = self._skeleton_file()
+        if os.path.exists(skeleton_file):
+            cached = Path(skeleton_file).read_text(encoding='utf-8')
+            if cached.startswith(header):
+                print("Using cached map skeleton")
+                return cached[len(header):]
+
+        m = self.create_heatmap(gradient=gradient, center=center, zoom_start=zoom_start)
+        skeleton = m.get_root().render()
+
+        tmp_file = skeleton_file + '.tmp'
+        Path(tmp_file).write_text(header + skeleton, encoding='utf-8')
+        os.replace(tmp_file, skeleton_file)
+        return skeleton
+
+    def render_footer(self):
+        """Fill in the footer with the activity count and latest activity"""
+        stats = load_stats()
+        last_activity = stats.get('last_activity') or {}
+        return self.FOOTER_TEMPLATE.format_map({
+            'activities': stats.get('total_activities', self.activity_count),
+            'latest': escape(last_activity.get('name', '—')),
+            'date': escape(last_activity.get('date', '—'))
+        })
+
+    def generate(self, open_browser=True, gradient=None):
         """Main generation process"""
         if not self.load_geojson():
             return False
 
-        # Create heatmap
-        m = self.create_heatmap()
-
-        if not m:
+        if not len(self.all_points):
             print("Failed to create heatmap")
             return False
 
-        # Save to HTML
-        m.save(self.output_file)
+        # Page around the heatmap, with mobile fixes already applied
+        skeleton = self.render_skeleton(gradient=gradient)
 
-        # Post-process to add mobile resize handling
-        self._inject_mobile_fix()
+        # Create heatmap
+        print("Generating heatmap...")
+        weighted_points = self.bin_points()
+        print(f"Binned into {len(weighted_points):,} weighted cells")
+
+        # Splice the footer and points into the skeleton and save to HTML.
+        # Split on the data marker first: the footer holds activity names,
+        # which could contain the marker text themselves.
+        head, _, tail = skeleton.partition(HEATMAP_DATA_MARKER)
+        head = head.replace(FOOTER_MARKER, self.render_footer(), 1)
+        with open(self.output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(head)
+            f.write(orjson.dumps(weighted_points).decode())
+            f.write(tail)
+        write_precompressed(self.output_file)
 
         print(f"\n{'='*60}")
         print(f"✓ Heatmap saved to {self.output_file}")
@@ -309,9 +513,12 @@ def main():
             print(f"Unknown color scheme '{scheme}', using default")
             print(f"Available schemes: {', '.join(gradients.keys())}")
 
+    # Only open a browser for interactive runs; CI runners are headless
+    # and browser discovery there can stall the build
+    open_browser = sys.stdout.isatty() and not os.environ.get('CI')
+
     generator = HeatmapGenerator()
-    generator.create_heatmap(gradient=gradient)
-    generator.generate()
+    generator.generate(open_browser=open_browser, gradient=gradient)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Generate a static PNG heatmap from GeoJSON activity data.
+Rasterizes all GPS points at build time, so viewing the image costs the
+same regardless of how many points there are.
+"""
+
+import functools
+import math
+import numpy as np
+from PIL import Image, ImageColor
+from scipy.ndimage import gaussian_filter
+from generate_heatmap import HeatmapGenerator
+
+
+def colormap_lut(gradient):
+    """Return a 256-entry RGBA lookup table for a color gradient
+
+    Colors are linearly interpolated between the gradient stops, like
+    Leaflet.heat does for the interactive map. Tables are built once per
+    gradient and shared, so treat the result as read-only.
+
+    Args:
+        gradient: Dictionary mapping stop positions in [0, 1] to color names
+    """
+    return _colormap_lut(tuple(sorted(gradient.items())))
+
+
+@functools.lru_cache(maxsize=8)
+def _colormap_lut(stops):
+    """Build the lookup table for sorted (position, color) stops"""
+    positions = [position for position, _ in stops]
+    colors = np.array([ImageColor.getrgb(color)[:3] for _, color in stops], dtype=np.float64)
+
+    x = np.linspace(0, 1, 256)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.round(np.interp(x, positions, colors[:, channel]))
+    lut[:, 3] = 255
+    lut.flags.writeable = False
+    return lut
+
+
+class StaticHeatmapGenerator:
+    """Generate a static heatmap image from activity data"""
+
+    def __init__(self, geojson_file='activities.geojson', output_file='heatmap_static.png'):
+        self.geojson_file = geojson_file
+        self.output_file = output_file
+        self.all_points = np.empty((0, 2))
+
+    def load_geojson(self):
+        """Load GPS points using the interactive heatmap's loader and cache"""
+        loader = HeatmapGenerator(geojson_file=self.geojson_file)
+        if not loader.load_geojson():
+            return False
+
+        self.all_points = loader.all_points
+        return True
+
+    def _histogram(self, lat_range, lon_range, bins):
+        """Count points per pixel over a uniform bins x bins grid
+
+        Equivalent to np.histogram2d, but computes each point's pixel
+        directly and counts with np.bincount instead of binary-searching
+        the bin edges.
+        """
+        lat_idx = np.floor(
+            (self.all_points[:, 0] - lat_range[0]) * (bins / (lat_range[1] - lat_range[0]))
+        ).astype(np.int64)
+        lon_idx = np.floor(
+            (self.all_points[:, 1] - lon_range[0]) * (bins / (lon_range[1] - lon_range[0]))
+        ).astype(np.int64)
+
+        inside = (lat_idx >= 0) & (lat_idx < bins) & (lon_idx >= 0) & (lon_idx < bins)
+        counts = np.bincount(lat_idx[inside] * bins + lon_idx[inside], minlength=bins * bins)
+        return counts.reshape(bins, bins).astype(np.float64)
+
+    def create_heatmap(self, gradient=None, center=None, span=0.3, bins=400, sigma=1.0, size=1200):
+        """Rasterize the points around center and save the image
+
+        Args:
+            gradient: Color gradient dictionary
+            center: [lat, lon] to center the image (default: Anchorage, AK)
+            span: Height of the image in degrees of latitude
+            bins: Number of pixels along each axis of the histogram
+            sigma: Gaussian blur radius in pixels
+            size: Width and height of the saved image in pixels
+        """
+        if not len(self.all_points):
+            return False
+
+        # Same default view as the interactive heatmap
+        if center is None:
+            center = [61.2027, -149.8691]  # Anchorage, AK
+
+        # Default gradient (blue to red)
+        if gradient is None:
+            gradient = {
+                0.0: 'blue',
+                0.3: 'cyan',
+                0.5: 'lime',
+                0.7: 'yellow',
+                1.0: 'red'
+            }
+
+        # Widen the longitude range so the image covers a square area
+        lat_span = span
+        lon_span = span / math.cos(math.radians(center[0]))
+        lat_range = [center[0] - lat_span / 2, center[0] + lat_span / 2]
+        lon_range = [center[1] - lon_span / 2, center[1] + lon_span / 2]
+
+        print(f"Rasterizing {len(self.all_points):,} GPS points...")
+        H = self._histogram(lat_range, lon_range, bins)
+
+        # Blur, then log-scale so individual tracks stay visible next to
+        # heavily repeated routes
+        H = np.log1p(gaussian_filter(H, sigma))
+        if not H.any():
+            print("No GPS points inside the image bounds")
+            return False
+
+        # Map intensities onto the gradient; empty pixels stay transparent
+        levels = np.round(H * (255 / H.max())).astype(np.uint8)
+        rgba = colormap_lut(gradient)[levels]
+        rgba[H <= 0] = 0
+
+        # Row 0 of the histogram is the southern edge, so flip it to put
+        # north at the top, then smooth it up to the output size
+        image = Image.fromarray(rgba[::-1], 'RGBA')
+        if size != bins:
+            image = image.resize((size, size), Image.Resampling.BILINEAR)
+        image.save(self.output_file, 'PNG')
+        return True
+
+    def generate(self, gradient=None):
+        """Main generation process"""
+        if not self.load_geojson():
+            return False
+
+        if not self.create_heatmap(gradient=gradient):
+            print("Failed to create static heatmap")
+            return False
+
+        print(f"\n{'='*60}")
+        print(f"✓ Static heatmap saved to {self.output_file}")
+        print(f"{'='*60}")
+        return True
+
+
+def main():
+    """Main function"""
+    generator = StaticHeatmapGenerator()
+    generator.generate()
+
+
+if __name__ == "__main__":
+    main()
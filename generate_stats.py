@@ -3,17 +3,20 @@
 Generate statistics from activities.geojson for the website.
 """
 
-import json
+import ijson
+import orjson
 import os
 from datetime import datetime
 from collections import defaultdict
+from operator import itemgetter
+from utils import find_geojson, open_geojson
 
 
 class StatsGenerator:
     """Generate activity statistics"""
 
     def __init__(self, geojson_file='activities.geojson'):
-        self.geojson_file = geojson_file
+        self.geojson_file = find_geojson(geojson_file)
         self.stats = {}
 
     def generate(self):
@@ -22,71 +25,76 @@ class StatsGenerator:
             print(f"Error: {self.geojson_file} not found!")
             return None
 
-        with open(self.geojson_file, 'r') as f:
-            data = json.load(f)
-
-        features = data.get('features', [])
-
-        if not features:
-            return None
-
-        # Basic stats
-        total_activities = len(features)
-        total_points = sum(len(f['geometry']['coordinates']) for f in features)
-
-        # Activity types
+        # Stream features and aggregate everything in a single pass; only
+        # the earliest time and the latest activity are tracked for the
+        # date range
+        total_activities = 0
+        total_points = 0
+        lat_sum = 0
+        lon_sum = 0
         activity_types = defaultdict(int)
-        for feature in features:
-            activity_type = feature['properties'].get('type', 'Unknown')
-            activity_types[activity_type] += 1
-
-        # Distance stats (if available)
         total_distance = 0
         activities_with_distance = 0
-        for feature in features:
-            distance = feature['properties'].get('distance', 0)
-            if distance > 0:
-                total_distance += distance
-                activities_with_distance += 1
-
-        # Time range and find last activity
-        times_with_features = []
-        for feature in features:
-            time_str = feature['properties'].get('time')
-            if time_str:
-                try:
-                    time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-                    times_with_features.append((time, feature))
-                except:
-                    pass
+        first_time = None
+        last_time = None
+        last_props = None
+        with open_geojson(self.geojson_file) as f:
+            for feature in ijson.items(f, 'features.item', use_float=True):
+                total_activities += 1
+                props = feature['properties']
+
+                # Point count and centroid sums
+                coords = feature['geometry']['coordinates']
+                total_points += len(coords)
+                lat_sum += sum(c[1] for c in coords)
+                lon_sum += sum(c[0] for c in coords)
+
+                # Activity types
+                activity_types[props.get('type', 'Unknown')] += 1
+
+                # Distance stats (if available)
+                distance = props.get('distance', 0)
+                if distance > 0:
+                    total_distance += distance
+                    activities_with_distance += 1
+
+                # Time range
+                time_str = props.get('time')
+                if time_str:
+                    try:
+                        time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+                    except:
+                        pass
+                    else:
+                        if first_time is None or time < first_time:
+                            first_time = time
+                        # On ties the later feature wins
+                        if last_time is None or time >= last_time:
+                            last_time, last_props = time, props
+
+        if not total_activities:
+            return None
 
         first_activity = None
         last_activity = None
         last_activity_details = None
 
-        if times_with_features:
-            times_with_features.sort(key=lambda x: x[0])
-            first_activity = times_with_features[0][0].strftime('%Y-%m-%d')
+        if last_time is not None:
+            first_activity = first_time.strftime('%Y-%m-%d')
 
             # Get last activity details
-            last_time, last_feature = times_with_features[-1]
             last_activity = last_time.strftime('%Y-%m-%d')
 
             last_activity_details = {
-                'name': last_feature['properties'].get('name', 'Unnamed'),
-                'type': last_feature['properties'].get('type', 'Activity'),
+                'name': last_props.get('name', 'Unnamed'),
+                'type': last_props.get('type', 'Activity'),
                 'date': last_time.strftime('%b %d, %Y'),
-                'distance_km': round(last_feature['properties'].get('distance', 0) / 1000, 1) if last_feature['properties'].get('distance') else None
+                'distance_km': round(last_props.get('distance', 0) / 1000, 1) if last_props.get('distance') else None
             }
 
         # Calculate center point
-        all_coords = []
-        for feature in features:
-            coords = feature['geometry']['coordinates']
-            all_coords.extend(coords)
-
-        avg_lat = sum(c[1] for c in all_coords) / len(all_coords)
-        avg_lon = sum(c[0] for c in all_coords) / len(all_coords)
+        avg_lat = lat_sum / total_points
+        avg_lon = lon_sum / total_points
 
         # Build stats object
         self.stats = {
@@ -117,8 +125,8 @@ class StatsGenerator:
             print("No stats to save")
             return
 
-        with open(output_file, 'w') as f:
-            json.dump(self.stats, f, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(self.stats, option=orjson.OPT_INDENT_2))
 
         print(f"✓ Stats saved to {output_file}")
 
@@ -139,7 +147,7 @@ class StatsGenerator:
         print(f"\nDate Range: {self.stats['date_range']['first']} to {self.stats['date_range']['last']}")
 
         print(f"\nActivity Types:")
-        for activity_type, count in sorted(self.stats['activity_types'].items(), key=lambda x: x[1], reverse=True):
+        for activity_type, count in sorted(self.stats['activity_types'].items(), key=itemgetter(1), reverse=True):
             print(f"  {activity_type}: {count}")
 
         print(f"\nMap Center: {self.stats['center']['lat']}, {self.stats['center']['lon']}")
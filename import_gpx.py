@@ -4,11 +4,85 @@ Import GPX files from Strava bulk export into GeoJSON format.
 This script processes all GPX files and creates a combined GeoJSON file.
 """
 
-import gpxpy
-import json
 import os
+import xml.etree.ElementTree as ET
+import numpy as np
+import orjson
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from generate_heatmap import HeatmapGenerator
+from utils import (
+    FEATURE_SEPARATOR, FEATURES_START, METADATA_END, METADATA_START, write_geojson
+)
+
+
+def parse_gpx_file(gpx_path):
+    """Parse a single GPX file into a GeoJSON feature
+
+    Module-level so it can be pickled and run in worker processes.
+    """
+    try:
+        coordinates = []
+        activity_name = None
+        activity_time = None
+        track_index = 0
+
+        # Stream the XML so each track point is read and freed as soon
+        # as its closing tag is parsed, instead of building a full tree
+        for _, elem in ET.iterparse(gpx_path, events=('end',)):
+            tag = elem.tag.rpartition('}')[2]
+
+            if tag == 'trkpt':
+                elevation = elem.findtext('{*}ele')
+                # GeoJSON uses [longitude, latitude] order
+                coordinates.append([
+                    float(elem.get('lon')),
+                    float(elem.get('lat')),
+                    float(elevation) if elevation else 0
+                ])
+                # Activity time is the first point of the first track
+                if track_index == 0 and activity_time is None:
+                    activity_time = elem.findtext('{*}time')
+                elem.clear()
+            elif tag == 'trkseg':
+                elem.clear()
+            elif tag == 'trk':
+                if track_index == 0:
+                    activity_name = elem.findtext('{*}name')
+                track_index += 1
+                elem.clear()
+
+        if not coordinates:
+            return None
+
+        # Get metadata
+        if not activity_name:
+            activity_name = os.path.basename(gpx_path)
+
+        if activity_time:
+            activity_time = datetime.fromisoformat(activity_time.replace('Z', '+00:00')).isoformat()
+
+        # Create GeoJSON feature
+        feature = {
+            "type": "Feature",
+            "properties": {
+                "name": activity_name,
+                "time": activity_time,
+                "source_file": os.path.basename(gpx_path),
+                "point_count": len(coordinates)
+            },
+            "geometry": {
+                "type": "LineString",
+                "coordinates": coordinates
+            }
+        }
+
+        return feature
+
+    except Exception as e:
+        print(f"Error processing {gpx_path}: {e}")
+        return None
 
 
 class GPXImporter:
@@ -16,65 +90,13 @@ class GPXImporter:
 
     def __init__(self, output_file='activities.geojson'):
         self.output_file = output_file
-        self.features = []
         self.stats = {
             'total_files': 0,
             'successful': 0,
             'failed': 0,
             'total_points': 0
         }
-
-    def import_gpx_file(self, gpx_path):
-        """Import a single GPX file and convert to GeoJSON feature"""
-        try:
-            with open(gpx_path, 'r') as gpx_file:
-                gpx = gpxpy.parse(gpx_file)
-
-            # Extract all track points
-            coordinates = []
-            for track in gpx.tracks:
-                for segment in track.segments:
-                    for point in segment.points:
-                        # GeoJSON uses [longitude, latitude] order
-                        coordinates.append([
-                            point.longitude,
-                            point.latitude,
-                            point.elevation if point.elevation else 0
-                        ])
-
-            if not coordinates:
-                return None
-
-            # Get metadata
-            activity_name = gpx.tracks[0].name if gpx.tracks and gpx.tracks[0].name else os.path.basename(gpx_path)
-            activity_time = None
-
-            if gpx.tracks and gpx.tracks[0].segments and gpx.tracks[0].segments[0].points:
-                activity_time = gpx.tracks[0].segments[0].points[0].time
-                if activity_time:
-                    activity_time = activity_time.isoformat()
-
-            # Create GeoJSON feature
-            feature = {
-                "type": "Feature",
-                "properties": {
-                    "name": activity_name,
-                    "time": activity_time,
-                    "source_file": os.path.basename(gpx_path),
-                    "point_count": len(coordinates)
-                },
-                "geometry": {
-                    "type": "LineString",
-                    "coordinates": coordinates
-                }
-            }
-
-            self.stats['total_points'] += len(coordinates)
-            return feature
-
-        except Exception as e:
-            print(f"Error processing {gpx_path}: {e}")
-            return None
+        self.latest_time = None
 
     def import_directory(self, directory_path):
         """Import all GPX files from a directory"""
@@ -93,39 +115,72 @@ class GPXImporter:
         print(f"Found {len(gpx_files)} GPX files")
         print("Processing...")
 
-        for i, gpx_file in enumerate(gpx_files, 1):
-            self.stats['total_files'] += 1
+        # GPX parsing is pure-Python and CPU-bound, so spread the files
+        # across one worker process per core. Each feature is written out
+        # as soon as it arrives instead of collecting the whole
+        # FeatureCollection in memory first. Only the [lat, lon] points are
+        # kept, to seed the heatmap's points cache.
+        point_chunks = []
+        with ProcessPoolExecutor() as executor, write_geojson(self.output_file) as f:
+            f.write(FEATURES_START)
+            features = executor.map(parse_gpx_file, gpx_files, chunksize=8)
+
+            for i, feature in enumerate(features, 1):
+                self.stats['total_files'] += 1
+
+                if i % 10 == 0:
+                    print(f"Processed {i}/{len(gpx_files)} files...")
+
+                if feature:
+                    self.write_feature(f, feature)
+                    self.track_latest_time(feature['properties']['time'])
+                    coords = np.asarray(feature['geometry']['coordinates'], dtype=np.float64)
+                    point_chunks.append(coords[:, 1::-1])
+                    self.stats['successful'] += 1
+                    self.stats['total_points'] += feature['properties']['point_count']
+                else:
+                    self.stats['failed'] += 1
+
+            self.write_metadata(f)
 
-            if i % 10 == 0:
-                print(f"Processed {i}/{len(gpx_files)} files...")
-
-            feature = self.import_gpx_file(gpx_file)
+        print(f"\n✓ Saved to {self.output_file}")
 
-            if feature:
-                self.features.append(feature)
-                self.stats['successful'] += 1
-            else:
-                self.stats['failed'] += 1
+        # The heatmap can then skip parsing the file we just wrote
+        if point_chunks:
+            heatmap = HeatmapGenerator(geojson_file=self.output_file)
+            heatmap.prime_cache(np.concatenate(point_chunks, axis=0), self.stats['successful'])
 
-        self.save_geojson()
         self.print_stats()
 
-    def save_geojson(self):
-        """Save features to GeoJSON file"""
-        geojson = {
-            "type": "FeatureCollection",
-            "metadata": {
-                "generated": datetime.now().isoformat(),
-                "total_activities": len(self.features),
-                "total_points": self.stats['total_points']
-            },
-            "features": self.features
+    def write_feature(self, f, feature):
+        """Append one compact feature to the open FeatureCollection"""
+        if self.stats['successful']:
+            f.write(FEATURE_SEPARATOR)
+        f.write(orjson.dumps(feature))
+
+    def track_latest_time(self, time_str):
+        """Remember the latest activity time for the metadata block"""
+        if time_str and (
+            self.latest_time is None
+            or datetime.fromisoformat(time_str) > datetime.fromisoformat(self.latest_time)
+        ):
+            self.latest_time = time_str
+
+    def write_metadata(self, f):
+        """Close the features array and write the metadata block
+
+        Metadata goes after the features since the totals are only known
+        once every file has been processed.
+        """
+        metadata = {
+            "generated": datetime.now().isoformat(),
+            "total_activities": self.stats['successful'],
+            "total_points": self.stats['total_points'],
+            "last_activity_time": self.latest_time
         }
-
-        with open(self.output_file, 'w') as f:
-            json.dump(geojson, f, indent=2)
-
-        print(f"\n✓ Saved to {self.output_file}")
+        f.write(METADATA_START)
+        f.write(orjson.dumps(metadata))
+        f.write(METADATA_END)
 
     def print_stats(self):
         """Print import statistics"""
@@ -144,15 +199,17 @@ def main():
     import sys
 
     if len(sys.argv) < 2:
-        print("Usage: python import_gpx.py <path_to_gpx_directory>")
+        print("Usage: python import_gpx.py <path_to_gpx_directory> [output_file]")
         print("\nExample:")
         print("  python import_gpx.py ./strava_export/activities")
         print("\nThis will create activities.geojson with all your GPS tracks")
+        print("An output_file ending in .gz is written gzip-compressed")
         return
 
     directory_path = sys.argv[1]
+    output_file = sys.argv[2] if len(sys.argv) > 2 else 'activities.geojson'
 
-    importer = GPXImporter(output_file='activities.geojson')
+    importer = GPXImporter(output_file=output_file)
     importer.import_directory(directory_path)
 
 
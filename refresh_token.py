@@ -4,14 +4,17 @@ Helper script to refresh Strava access token using a refresh token.
 Used in automated workflows (GitHub Actions).
 """
 
-import requests
 import json
 import os
 import sys
+from strava_activities import StravaAuth
 
 
 def refresh_access_token():
-    """Refresh the access token using refresh token"""
+    """Refresh the access token using refresh token
+
+    Skips the refresh when the saved access token is still valid.
+    """
 
     # Try to load from environment first (GitHub Actions)
     client_id = os.environ.get('STRAVA_CLIENT_ID')
@@ -26,47 +29,38 @@ def refresh_access_token():
                 client_id = config.get('client_id')
                 client_secret = config.get('client_secret')
 
+    tokens = {}
+    if os.path.exists('strava_tokens.json'):
+        with open('strava_tokens.json', 'r') as f:
+            tokens = json.load(f)
+
     if not refresh_token:
-        if os.path.exists('strava_tokens.json'):
-            with open('strava_tokens.json', 'r') as f:
-                tokens = json.load(f)
-                refresh_token = tokens.get('refresh_token')
+        refresh_token = tokens.get('refresh_token')
 
     if not all([client_id, client_secret, refresh_token]):
         print("Error: Missing credentials for token refresh")
         print("Need: STRAVA_CLIENT_ID, STRAVA_CLIENT_SECRET, STRAVA_REFRESH_TOKEN")
         return None
 
-    # Request new access token
-    response = requests.post(
-        'https://www.strava.com/oauth/token',
-        data={
-            'client_id': client_id,
-            'client_secret': client_secret,
-            'grant_type': 'refresh_token',
-            'refresh_token': refresh_token
-        }
-    )
+    auth = StravaAuth(client_id, client_secret)
+    auth.access_token = tokens.get('access_token')
+    auth.refresh_token = refresh_token
+    auth.expires_at = tokens.get('expires_at', 0)
 
-    if response.status_code != 200:
-        print(f"Error refreshing token: {response.status_code}")
-        print(response.text)
-        return None
+    if auth.token_is_valid():
+        print("✓ Saved access token is still valid")
+        return tokens
 
-    data = response.json()
+    # Request new access token
+    if not auth.refresh():
+        return None
 
-    # Save new tokens
-    tokens = {
-        'access_token': data['access_token'],
-        'refresh_token': data['refresh_token']
+    return {
+        'access_token': auth.access_token,
+        'refresh_token': auth.refresh_token,
+        'expires_at': auth.expires_at
     }
 
-    with open('strava_tokens.json', 'w') as f:
-        json.dump(tokens, f)
-
-    print("✓ Token refreshed successfully")
-    return tokens
-
 
 if __name__ == "__main__":
     result = refresh_access_token()
@@ -5,11 +5,43 @@ A simple script to authenticate with Strava API and fetch your latest activities
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import json
+import orjson
 import webbrowser
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import os
+import time
+
+
+def create_session(access_token=None):
+    """Create a requests session that keeps its connections to Strava open
+
+    Reusing one session across calls skips a new TCP and TLS handshake for
+    every request. GET requests that hit Strava's rate limit or a server
+    error are retried with exponential backoff, waiting as long as the
+    Retry-After header asks for when it is present. POSTs are never
+    retried, since an OAuth code can only be exchanged once.
+
+    Args:
+        access_token: Optional bearer token to send with every request
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=5,
+        backoff_factor=1.0,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        # Hand the last response back instead of raising, so callers'
+        # status checks still see a rate limit that outlasted the retries
+        raise_on_status=False
+    )
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    if access_token:
+        session.headers['Authorization'] = f'Bearer {access_token}'
+    return session
 
 
 class StravaAuth:
@@ -21,6 +53,8 @@ class StravaAuth:
         self.auth_code = None
         self.access_token = None
         self.refresh_token = None
+        self.expires_at = 0
+        self.session = create_session()
 
     def authenticate(self):
         """Run the OAuth flow to get access token"""
@@ -28,11 +62,19 @@ class StravaAuth:
         if os.path.exists('strava_tokens.json'):
             with open('strava_tokens.json', 'r') as f:
                 tokens = json.load(f)
-                self.access_token = tokens.get('access_token')
-                self.refresh_token = tokens.get('refresh_token')
+            self.access_token = tokens.get('access_token')
+            self.refresh_token = tokens.get('refresh_token')
+            self.expires_at = tokens.get('expires_at', 0)
+
+            if self.token_is_valid():
                 print("Loaded saved tokens")
                 return
 
+            # Expired (or saved without an expiry): refresh instead of
+            # letting every API call fail with a 401
+            if self.refresh_token and self.refresh():
+                return
+
         # Start OAuth flow
         auth_url = (
             f"https://www.strava.com/oauth/authorize?"
@@ -52,33 +94,93 @@ class StravaAuth:
         # Exchange code for token
         self._exchange_code_for_token()
 
+    def token_is_valid(self):
+        """Check whether the access token is good for at least another minute"""
+        return bool(self.access_token) and self.expires_at - 60 > time.time()
+
+    def refresh(self):
+        """Exchange the refresh token for a new access token
+
+        Returns:
+            True if the token was refreshed and saved
+        """
+        response = self.session.post(
+            'https://www.strava.com/oauth/token',
+            data={
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token
+            }
+        )
+
+        if response.status_code != 200:
+            print(f"Error refreshing token: {response.status_code}")
+            print(response.text)
+            return False
+
+        self._save_tokens(response.json())
+        print("✓ Token refreshed successfully")
+        return True
+
+    def _save_tokens(self, data):
+        """Keep the tokens from a token response and save them for future use"""
+        self.access_token = data['access_token']
+        self.refresh_token = data['refresh_token']
+        self.expires_at = data.get('expires_at', 0)
+
+        with open('strava_tokens.json', 'w') as f:
+            json.dump({
+                'access_token': self.access_token,
+                'refresh_token': self.refresh_token,
+                'expires_at': self.expires_at
+            }, f)
+
     def _start_callback_server(self):
         """Start a local server to receive the OAuth callback"""
         auth_instance = self
 
         class CallbackHandler(BaseHTTPRequestHandler):
             def do_GET(self):
-                query_components = parse_qs(urlparse(self.path).query)
+                url = urlparse(self.path)
+
+                # Ignore favicon and prefetch requests so they don't use up
+                # the wait for the real redirect
+                if url.path != '/authorized':
+                    self.send_response(204)
+                    self.end_headers()
+                    return
+
+                query_components = parse_qs(url.query)
                 auth_instance.auth_code = query_components.get('code', [None])[0]
+                self.server.callback_received = True
 
                 self.send_response(200)
                 self.send_header('Content-type', 'text/html')
                 self.end_headers()
-                self.wfile.write(b'<html><body><h1>Authorization successful!</h1><p>You can close this window and return to your terminal.</p></body></html>')
+                if auth_instance.auth_code:
+                    self.wfile.write(b'<html><body><h1>Authorization successful!</h1><p>You can close this window and return to your terminal.</p></body></html>')
+                else:
+                    self.wfile.write(b'<html><body><h1>Authorization failed</h1><p>No authorization code was received. Check your terminal.</p></body></html>')
 
             def log_message(self, format, *args):
                 pass  # Suppress server logs
 
         server = HTTPServer(('localhost', 8000), CallbackHandler)
+        server.callback_received = False
         print("Waiting for authorization...")
-        server.handle_request()
+        try:
+            while not server.callback_received:
+                server.handle_request()
+        finally:
+            server.server_close()
 
     def _exchange_code_for_token(self):
         """Exchange authorization code for access token"""
         if not self.auth_code:
             raise Exception("No authorization code received")
 
-        response = requests.post(
+        response = self.session.post(
             'https://www.strava.com/oauth/token',
             data={
                 'client_id': self.client_id,
@@ -89,17 +191,7 @@ class StravaAuth:
         )
 
         if response.status_code == 200:
-            data = response.json()
-            self.access_token = data['access_token']
-            self.refresh_token = data['refresh_token']
-
-            # Save tokens for future use
-            with open('strava_tokens.json', 'w') as f:
-                json.dump({
-                    'access_token': self.access_token,
-                    'refresh_token': self.refresh_token
-                }, f)
-
+            self._save_tokens(response.json())
             print("Authentication successful!")
         else:
             raise Exception(f"Token exchange failed: {response.text}")
@@ -111,23 +203,20 @@ class StravaClient:
     def __init__(self, access_token):
         self.access_token = access_token
         self.base_url = "https://www.strava.com/api/v3"
+        self.session = create_session(access_token)
 
     def get_athlete(self):
         """Get authenticated athlete info"""
-        response = requests.get(
-            f"{self.base_url}/athlete",
-            headers={'Authorization': f'Bearer {self.access_token}'}
-        )
-        return response.json() if response.status_code == 200 else None
+        response = self.session.get(f"{self.base_url}/athlete")
+        return orjson.loads(response.content) if response.status_code == 200 else None
 
     def get_activities(self, per_page=10):
         """Get athlete's recent activities"""
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/athlete/activities",
-            headers={'Authorization': f'Bearer {self.access_token}'},
             params={'per_page': per_page}
         )
-        return response.json() if response.status_code == 200 else None
+        return orjson.loads(response.content) if response.status_code == 200 else None
 
     def display_activities(self, activities):
         """Display activities in a readable format"""
@@ -4,19 +4,49 @@ Fetch new activities from Strava API and update GeoJSON file.
 This script checks for activities newer than the latest one in the GeoJSON file.
 """
 
-import requests
 import json
+import ijson
+import itertools
+import numpy as np
+import orjson
 import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from strava_activities import StravaAuth
+from strava_activities import StravaAuth, create_session
+from utils import (
+    append_features, find_geojson, open_geojson, read_metadata_tail,
+    write_feature_collection, write_geojson
+)
+
+
+def parse_activity_time(time_str):
+    """Parse an ISO 8601 activity start time, including Strava's trailing Z"""
+    return datetime.fromisoformat(time_str.replace('Z', '+00:00'))
+
+
+def latest_activity_time(time_strs):
+    """Return the latest of the given activity time strings, skipping empty ones"""
+    return max(filter(None, time_strs), key=parse_activity_time, default=None)
 
 
 class ActivityUpdater:
     """Update GeoJSON with new Strava activities"""
 
-    def __init__(self, geojson_file='activities.geojson'):
-        self.geojson_file = geojson_file
+    ACTIVITIES_URL = 'https://www.strava.com/api/v3/athlete/activities'
+    STREAM_URL = 'https://www.strava.com/api/v3/activities/{}/streams'
+
+    def __init__(self, geojson_file='activities.geojson', max_workers=4, include_altitude=False):
+        self.geojson_file = find_geojson(geojson_file)
+        self.max_workers = max_workers
+        self.include_altitude = include_altitude
+        # Same query for every stream request, so build it once
+        self.stream_params = {
+            'keys': 'latlng,altitude' if include_altitude else 'latlng',
+            'key_by_type': True
+        }
         self.access_token = None
+        self.session = None
         self.new_activities = 0
 
     def authenticate(self):
@@ -31,6 +61,7 @@ class ActivityUpdater:
         auth = StravaAuth(config['client_id'], config['client_secret'])
         auth.authenticate()
         self.access_token = auth.access_token
+        self.session = create_session(self.access_token)
         return True
 
     def get_latest_activity_time(self):
@@ -38,38 +69,35 @@ class ActivityUpdater:
         if not os.path.exists(self.geojson_file):
             return None
 
-        with open(self.geojson_file, 'r') as f:
-            data = json.load(f)
-
-        if not data.get('features'):
-            return None
+        # Files written by import_gpx.py and this script record the latest
+        # activity time in their metadata block at the end of the file
+        tail = read_metadata_tail(self.geojson_file)
+        if tail and tail[1].get('last_activity_time'):
+            return parse_activity_time(tail[1]['last_activity_time'])
 
-        # Find the most recent activity
-        latest_time = None
-        for feature in data['features']:
-            time_str = feature['properties'].get('time')
-            if time_str:
-                time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-                if not latest_time or time > latest_time:
-                    latest_time = time
+        # Otherwise find the most recent activity, streaming just the
+        # activity times so the coordinates are never turned into Python
+        # objects
+        with open_geojson(self.geojson_file) as f:
+            latest_time = latest_activity_time(ijson.items(f, 'features.item.properties.time'))
 
-        return latest_time
+        return parse_activity_time(latest_time) if latest_time else None
 
     def fetch_activity_stream(self, activity_id):
         """Fetch GPS stream data for an activity"""
-        response = requests.get(
-            f"https://www.strava.com/api/v3/activities/{activity_id}/streams",
-            headers={'Authorization': f'Bearer {self.access_token}'},
-            params={
-                'keys': 'latlng,altitude',
-                'key_by_type': True
-            }
+        response = self.session.get(
+            self.STREAM_URL.format(activity_id),
+            params=self.stream_params
         )
 
-        if response.status_code != 200:
+        # Activities without GPS have no streams. Anything else that still
+        # fails after the session's retries is raised, so the caller can
+        # stop before saving instead of dropping the activity for good.
+        if response.status_code == 404:
             return None
+        response.raise_for_status()
 
-        return response.json()
+        return orjson.loads(response.content)
 
     def fetch_new_activities(self):
         """Fetch activities from Strava API"""
@@ -79,23 +107,41 @@ class ActivityUpdater:
         if latest_time:
             print(f"Looking for activities after {latest_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        # Fetch recent activities
-        response = requests.get(
-            "https://www.strava.com/api/v3/athlete/activities",
-            headers={'Authorization': f'Bearer {self.access_token}'},
-            params={'per_page': 100}  # Adjust as needed
-        )
-
-        if response.status_code != 200:
-            print(f"Error fetching activities: {response.status_code}")
-            return []
-
-        activities = response.json()
-
-        # Filter for new activities
+        # Let Strava filter by start time, so only new activities are sent.
+        # Without a previous activity, just the most recent page is fetched.
+        params = {'per_page': 100}  # Adjust as needed
+        if latest_time:
+            params['after'] = int(latest_time.timestamp())
+
+        activities = []
+        page = 1
+        while True:
+            try:
+                response = self.session.get(
+                    self.ACTIVITIES_URL,
+                    params={**params, 'page': page}
+                )
+            except requests.RequestException as e:
+                print(f"Error fetching activities: {e}")
+                return []
+
+            if response.status_code != 200:
+                print(f"Error fetching activities: {response.status_code}")
+                return []
+
+            batch = orjson.loads(response.content)
+            activities.extend(batch)
+
+            # A short page means there is nothing more after it
+            if not latest_time or len(batch) < params['per_page']:
+                break
+            page += 1
+
+        # Filter for new activities; 'after' has whole-second resolution, so
+        # the latest stored activity itself may still come back
         new_activities = []
         for activity in activities:
-            activity_time = datetime.fromisoformat(activity['start_date'].replace('Z', '+00:00'))
+            activity_time = parse_activity_time(activity['start_date'])
 
             if latest_time and activity_time <= latest_time:
                 continue
@@ -116,16 +162,24 @@ class ActivityUpdater:
         # Build coordinates array
         latlng = stream_data['latlng']['data']
         altitude = stream_data.get('altitude', {}).get('data', [])
-
-        coordinates = []
-        for i, (lat, lng) in enumerate(latlng):
-            alt = altitude[i] if i < len(altitude) else 0
-            # GeoJSON uses [longitude, latitude, altitude]
-            coordinates.append([lng, lat, alt])
-
-        if not coordinates:
+        if not latlng:
             return None
 
+        # GeoJSON uses [longitude, latitude, altitude]; without an altitude
+        # stream the points are written 2D, and points past the end of the
+        # altitude stream get an altitude of 0. Positions are rounded to 5
+        # decimals (about 1 m) and altitudes to 0.1 m, which is far finer
+        # than the heatmap can show and keeps the file much smaller.
+        positions = np.round(np.asarray(latlng, dtype=np.float64)[:, ::-1], 5)
+        if not altitude:
+            coordinates = positions.tolist()
+        else:
+            points = np.zeros((len(latlng), 3))
+            points[:, :2] = positions
+            altitude = altitude[:len(latlng)]
+            points[:len(altitude), 2] = np.round(altitude, 1)
+            coordinates = points.tolist()
+
         # Create feature
         feature = {
             "type": "Feature",
@@ -159,50 +213,107 @@ class ActivityUpdater:
 
         print(f"Found {len(new_activities)} new activities")
 
-        # Load existing GeoJSON
-        if os.path.exists(self.geojson_file):
-            with open(self.geojson_file, 'r') as f:
-                geojson = json.load(f)
-        else:
-            geojson = {
-                "type": "FeatureCollection",
-                "metadata": {},
-                "features": []
-            }
-
-        # Process each new activity
-        for i, activity in enumerate(new_activities, 1):
-            print(f"Processing {i}/{len(new_activities)}: {activity['name']}")
-
-            stream_data = self.fetch_activity_stream(activity['id'])
-            if not stream_data:
-                print(f"  ⚠ No GPS data available")
-                continue
-
-            feature = self.activity_to_geojson_feature(activity, stream_data)
-            if feature:
-                geojson['features'].append(feature)
-                self.new_activities += 1
-                print(f"  ✓ Added {len(feature['geometry']['coordinates'])} GPS points")
-
-        # Update metadata
-        total_points = sum(len(f['geometry']['coordinates']) for f in geojson['features'])
-        geojson['metadata'] = {
-            "last_updated": datetime.now().isoformat(),
-            "total_activities": len(geojson['features']),
-            "total_points": total_points
-        }
+        new_features = []
+
+        # Fetch the GPS streams a few at a time; the requests are network
+        # bound, and a small pool stays well within Strava's rate limits
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                streams = executor.map(
+                    self.fetch_activity_stream,
+                    [activity['id'] for activity in new_activities]
+                )
+
+                # Process each new activity, in order, as its stream arrives
+                for i, (activity, stream_data) in enumerate(zip(new_activities, streams), 1):
+                    print(f"Processing {i}/{len(new_activities)}: {activity['name']}")
+
+                    if not stream_data:
+                        print(f"  ⚠ No GPS data available")
+                        continue
+
+                    feature = self.activity_to_geojson_feature(activity, stream_data)
+                    if feature:
+                        new_features.append(feature)
+                        self.new_activities += 1
+                        print(f"  ✓ Added {len(feature['geometry']['coordinates'])} GPS points")
+        except requests.RequestException as e:
+            # Saving now would leave a gap that the next run skips over,
+            # since it only asks for activities after the latest one saved
+            print(f"Error fetching GPS streams: {e}")
+            print("No activities were saved; run again to retry")
+            return
 
-        # Save updated GeoJSON
-        with open(self.geojson_file, 'w') as f:
-            json.dump(geojson, f, indent=2)
+        total_activities, total_points = self.save_features(new_features)
 
         print(f"\n{'='*60}")
         print(f"✓ Added {self.new_activities} new activities to {self.geojson_file}")
-        print(f"Total activities: {len(geojson['features'])}")
+        print(f"Total activities: {total_activities}")
         print(f"Total GPS points: {total_points:,}")
         print(f"{'='*60}")
 
+    def save_features(self, new_features):
+        """Add new features to the GeoJSON file
+
+        Files in the appendable layout written by import_gpx.py and this
+        script only have their end rewritten. Anything else, such as older
+        pretty-printed or compressed files, is rewritten in full, which
+        also converts it to the appendable layout.
+
+        Returns:
+            (total_activities, total_points) after the update
+        """
+        new_points = sum(len(f['geometry']['coordinates']) for f in new_features)
+        new_times = [f['properties'].get('time') for f in new_features]
+
+        tail = None
+        if os.path.exists(self.geojson_file):
+            tail = read_metadata_tail(self.geojson_file)
+
+        if tail and 'total_activities' in tail[1] and 'total_points' in tail[1]:
+            offset, metadata = tail
+            total_activities = metadata['total_activities'] + len(new_features)
+            total_points = metadata['total_points'] + new_points
+            append_features(self.geojson_file, offset, new_features, {
+                "last_updated": datetime.now().isoformat(),
+                "total_activities": total_activities,
+                "total_points": total_points,
+                "last_activity_time": latest_activity_time(
+                    new_times + [metadata.get('last_activity_time')]
+                )
+            })
+            return total_activities, total_points
+
+        # Stream the existing features into a new file one at a time, so
+        # memory use doesn't grow with the size of the collection
+        totals = {'activities': 0, 'points': 0}
+        times = []
+
+        def all_features(old):
+            for feature in itertools.chain(old, new_features):
+                totals['activities'] += 1
+                totals['points'] += len(feature['geometry']['coordinates'])
+                times.append(feature['properties'].get('time'))
+                yield feature
+
+        def metadata():
+            return {
+                "last_updated": datetime.now().isoformat(),
+                "total_activities": totals['activities'],
+                "total_points": totals['points'],
+                "last_activity_time": latest_activity_time(times)
+            }
+
+        with write_geojson(self.geojson_file) as out:
+            if os.path.exists(self.geojson_file):
+                with open_geojson(self.geojson_file) as old:
+                    write_feature_collection(
+                        out, all_features(ijson.items(old, 'features.item', use_float=True)), metadata
+                    )
+            else:
+                write_feature_collection(out, all_features([]), metadata)
+        return totals['activities'], totals['points']
+
 
 def main():
     """Main function"""
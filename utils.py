@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the heatmap and website build scripts.
+"""
+
+import contextlib
+import functools
+import gzip
+import os
+from pathlib import Path
+
+import orjson
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Layout of the GeoJSON files written by these scripts: one compact feature
+# per line, with the metadata block last so new features can be appended by
+# rewriting only the end of the file
+FEATURES_START = b'{"type":"FeatureCollection","features":[\n'
+FEATURE_SEPARATOR = b',\n'
+METADATA_START = b'\n],"metadata":'
+METADATA_END = b'}\n'
+
+
+def load_stats(stats_file='stats.json'):
+    """Load stats.json, reusing the parsed result while the file is unchanged
+
+    The returned dict is shared between callers, so treat it as read-only.
+
+    Returns:
+        Stats dictionary, or an empty dict if the file does not exist
+    """
+    try:
+        st = os.stat(stats_file)
+    except FileNotFoundError:
+        return {}
+    return _load_stats(stats_file, st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_stats(stats_file, mtime_ns, size):
+    """Parse a stats file; cached on (path, mtime, size)"""
+    return orjson.loads(Path(stats_file).read_bytes())
+
+
+def write_precompressed(path):
+    """Write a gzip-compressed copy of a generated file next to it
+
+    Hosts that serve precompressed assets (e.g. nginx gzip_static, or S3
+    with Content-Encoding set) can then send path + '.gz' without
+    compressing the file on every request.
+
+    Args:
+        path: File to compress; the copy is written to path + '.gz'
+    """
+    data = Path(path).read_bytes()
+    # Maximum compression is affordable since this runs once per build;
+    # mtime=0 keeps the output identical across rebuilds of the same file
+    Path(f"{path}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+
+
+def find_geojson(path):
+    """Return the GeoJSON file to use for path
+
+    Falls back to a compressed path + '.gz' when only that exists, so the
+    scripts pick up an activities.geojson.gz written by import_gpx.py
+    without being told about it. Writers given the returned path keep the
+    file compressed, since compression follows the .gz suffix.
+    """
+    gz_path = f"{path}.gz"
+    if not os.path.exists(path) and os.path.exists(gz_path):
+        return gz_path
+    return path
+
+
+def open_geojson(path):
+    """Open a GeoJSON file for binary reading, decompressing it if gzipped
+
+    Compression is detected from the file's magic bytes rather than its
+    name, so readers work the same on plain and compressed files.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+@contextlib.contextmanager
+def write_geojson(path):
+    """Open a GeoJSON file for binary writing, replacing it only on success
+
+    Output is gzip-compressed when path ends in .gz. Everything is written
+    to a temporary file first, so an interrupted run leaves the previous
+    file intact.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            if str(path).endswith('.gz'):
+                # filename='' and mtime=0 keep the temporary name and build
+                # time out of the gzip header
+                with gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=6, mtime=0) as f:
+                    yield f
+            else:
+                yield raw
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def write_feature_collection(f, features, metadata):
+    """Write a complete FeatureCollection in the appendable layout
+
+    Args:
+        f: Binary file object to write to
+        features: Iterable of GeoJSON feature dicts
+        metadata: Metadata dict, written after the features, or a function
+            returning it that is called once all features are written
+    """
+    f.write(FEATURES_START)
+    for i, feature in enumerate(features):
+        if i:
+            f.write(FEATURE_SEPARATOR)
+        f.write(orjson.dumps(feature))
+    if callable(metadata):
+        metadata = metadata()
+    f.write(METADATA_START)
+    f.write(orjson.dumps(metadata))
+    f.write(METADATA_END)
+
+
+def read_metadata_tail(path, max_tail=65536):
+    """Read the metadata block from the end of an appendable GeoJSON file
+
+    Only the start and the last max_tail bytes of the file are read.
+
+    Returns:
+        (offset, metadata) with the byte offset where the metadata block
+        starts, or None if the file isn't in the appendable layout (e.g.
+        compressed or pretty-printed files)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(FEATURES_START)) != FEATURES_START:
+            return None
+        size = f.seek(0, os.SEEK_END)
+        start = max(len(FEATURES_START), size - max_tail)
+        f.seek(start)
+        tail = f.read()
+
+    # Raw newlines only appear between features, never inside strings, so
+    # the last METADATA_START is always the real one
+    index = tail.rfind(METADATA_START)
+    if index < 0 or not tail.endswith(METADATA_END):
+        return None
+    try:
+        metadata = orjson.loads(tail[index + len(METADATA_START):-len(METADATA_END)])
+    except orjson.JSONDecodeError:
+        return None
+    if not isinstance(metadata, dict):
+        return None
+    return start + index, metadata
+
+
+def append_features(path, offset, features, metadata):
+    """Append features to an appendable GeoJSON file in place
+
+    Overwrites the old metadata block at offset (from read_metadata_tail)
+    with the new features and metadata, so the cost depends only on the
+    size of the new data. The new tail is written with a single write call.
+
+    Args:
+        path: GeoJSON file to append to
+        offset: Byte offset of the existing metadata block
+        features: List of GeoJSON feature dicts to append
+        metadata: Metadata dict replacing the existing one
+    """
+    # No separator before the first feature of an empty collection
+    has_features = offset > len(FEATURES_START)
+    parts = []
+    for feature in features:
+        if has_features:
+            parts.append(FEATURE_SEPARATOR)
+        parts.append(orjson.dumps(feature))
+        has_features = True
+    parts.append(METADATA_START)
+    parts.append(orjson.dumps(metadata))
+    parts.append(METADATA_END)
+
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(b''.join(parts))
+        f.truncate()